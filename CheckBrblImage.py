@@ -1,27 +1,94 @@
 #!/usr/local/bin/python3
 # -*- coding: utf-8 -*-
 
-from PySide6.QtWidgets import QApplication, QMainWindow, QMessageBox, QHeaderView, QStyleFactory
-from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QThread, Signal, Slot, QMutex, QMutexLocker
-from PySide6.QtGui import QPixmap
+from PySide6.QtWidgets import QApplication, QMainWindow, QMessageBox, QHeaderView, QStyleFactory, QLabel, QProgressBar, QPushButton
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QThread, QTimer, Signal, Slot, QMutex, QMutexLocker
+from PySide6.QtGui import QPixmap, QImage, QImageWriter
 
 from ui.MainWindow_ui import Ui_MainWindow
 import resources_rc
 
-from library import MonitorDir
-import shutil
+from library import MonitorDir, TransferJob, DeleteQueue, ImageCache, ThumbnailLoader, FolderRecord, Status, Decision, THUMBNAIL_FORMATS, TRASH_NAME, thumbnail_file
+import multiprocessing
+import bisect
 import json
-import re
 import sys
 import os
 
 
 
 class ImagesTableModel(QAbstractTableModel):
-    def __init__(self, data, headers):
+    def __init__(self, headers):
         super().__init__()
-        self._data=data
+        self._keys=[]       # 按名称排序的图片清单 [(dir,name)]
+        self._data=[]
+        self._unchecked=[]  # 未确认的图片 [(dir,name)]，按名称排序
         self._headers=headers
+
+    @property
+    def keys(self):
+        return self._keys
+
+    def reset_rows(self, keys, rows):
+        # 切换型号时重新设置全部数据，keys 需按名称排序
+        self.beginResetModel()
+        self._keys[:] = keys
+        self._data[:] = rows
+        self._unchecked = [key for key,row in zip(keys,rows) if not row[2]]
+        self.endResetModel()
+
+    def row_of(self, key):
+        # 查找图片所在的行，不存在时返回 -1
+        idx = bisect.bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            return idx
+        return -1
+
+    def set_row(self, key, row):
+        # 更新图片所在的行，不存在时按顺序插入
+        self.set_unchecked(key, not row[2])
+        idx = bisect.bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            self._data[idx] = row
+            self.dataChanged.emit(self.index(idx,0), self.index(idx,len(self._headers)-1))
+        else:
+            self.beginInsertRows(QModelIndex(), idx, idx)
+            self._keys.insert(idx, key)
+            self._data.insert(idx, row)
+            self.endInsertRows()
+        return idx
+
+    def remove_row(self, key):
+        idx = self.row_of(key)
+        if idx < 0: return
+        self.set_unchecked(key, False)
+        self.beginRemoveRows(QModelIndex(), idx, idx)
+        del self._keys[idx]
+        del self._data[idx]
+        self.endRemoveRows()
+
+    def set_unchecked(self, key, unchecked):
+        idx = bisect.bisect_left(self._unchecked, key)
+        found = idx < len(self._unchecked) and self._unchecked[idx] == key
+        if unchecked and not found:
+            self._unchecked.insert(idx, key)
+        elif not unchecked and found:
+            del self._unchecked[idx]
+
+    def next_unchecked(self, key):
+        # 查找 key 之后的第一张未确认图片，到末尾后从头查找，全部已确认时返回 None
+        if not self._unchecked: return None
+        idx = bisect.bisect_right(self._unchecked, key)
+        return self._unchecked[idx % len(self._unchecked)]
+
+    def iter_unchecked(self, key):
+        # 依次返回 key 之后的未确认图片，到末尾后从头继续，不包括 key 本身
+        idx = bisect.bisect_right(self._unchecked, key)
+        for i in range(len(self._unchecked)):
+            unchecked = self._unchecked[(idx + i) % len(self._unchecked)]
+            if unchecked != key:
+                yield unchecked
+
     def rowCount(self, parent=QModelIndex()):
         return len(self._data)
 
@@ -56,14 +123,21 @@ class MainWindow(QMainWindow):
         self.load_config()
         self.mutex = QMutex()
         self.dirs = []      # 监控目录中的所有型号文件夹清单
-        self.images = {}    # 保存的图片信息数据，{(dir,name)} = {"status": status, "checked": checked}
-        self.data = []      # 当前型号的图片清单 [(dir,name)]
+        self.images = {}    # 保存的图片信息数据，{(dir,name): FolderRecord}
+        self.dirImages = {} # 按型号索引的图片名称，{dir: [name]}，按名称排序
+        self.data = []      # 当前型号的图片清单 [(dir,name)]，与表格模型共用，按名称排序
         self.currentIndex = -1
-        self.status = {
-            "ok": "✅",
-            "section": "⭕",
-            "error":"⚠️",
-            "delete": "❌"
+        self.currentThumbnails = {}     # 当前选中图片等待显示的缩略图 {key: label}
+        self.statusText = {
+            Status.NONE: "",
+            Status.OK: "✅",
+            Status.ERROR: "⚠️"
+        }
+        self.decisionText = {
+            Decision.NONE: "",
+            Decision.OK: "✅",
+            Decision.SECTION: "⭕",
+            Decision.DELETE: "❌"
         }
         
         self.setWindowTitle("波若波罗板厚测量确认")
@@ -77,7 +151,20 @@ class MainWindow(QMainWindow):
             "ImagesFolder":"D:\\PCBImages",
             "ThumbnailFolder":"Z:\\PCBImages",
             "SectionFolder":"Z:\\PCBSections",
-            "ProcessFolder":"D:\\PCBThickness"
+            "ProcessFolder":"D:\\PCBThickness",
+            "RenderWorkers":0,      # 生成缩略图的进程数量，0 表示在监控线程中生成
+            "DecodeThreads":0,      # 单个文件夹内并行解码图片的线程数量，0 表示依次解码
+            "FileWatcher":True,     # 是否使用文件夹变化事件触发扫描，不支持事件时自动退回定时轮询
+            "WatcherPollInterval":60,   # 使用文件夹变化事件时兜底轮询扫描的间隔（秒）
+            "SettleTime":10,        # 测量文件夹数据保持不变多少秒后才生成缩略图，0 表示不等待
+            "ThumbnailFormat":"png",    # 缩略图格式：png、jpg、webp，bmp 为不压缩
+            "ThumbnailQuality":-1,      # JPEG/WebP 图片质量 0~100，-1 表示默认值
+            "ThumbnailCompression":-1,  # PNG 压缩级别 0~9，-1 表示默认值
+            "ThumbnailCacheMB":64,      # 刚生成的缩略图在内存中缓存的容量（MB）
+            "PixmapCacheMB":32,         # 已缩放到显示尺寸的缩略图缓存容量（MB）
+            "PrefetchCount":3,          # 后台预读的待确认图片数量
+            "TransferStreams":4,        # 发送数据至不同分区的待处理文件夹时同时复制的文件数量
+            "DeleteThreads":4           # 后台删除已标记删除的测量文件夹时同时删除的文件数量
         }
         if os.path.isfile("config.json"):
             try:
@@ -97,24 +184,77 @@ class MainWindow(QMainWindow):
                 if not os.path.isdir(value):
                     QMessageBox.critical(self, "配置文件错误", f"设置项 {key} 指定的目录不存在:\n{value}")
                     sys.exit(1)
+        # 格式需要当前 Qt 有对应的图片插件才能保存
+        thumbnail_format = THUMBNAIL_FORMATS.get(str(self.config["ThumbnailFormat"]).lower())
+        supported = [bytes(f).decode() for f in QImageWriter.supportedImageFormats()]
+        if thumbnail_format not in supported:
+            QMessageBox.critical(self, "配置文件错误", f"设置项 ThumbnailFormat 不支持的格式:\n{self.config['ThumbnailFormat']}")
+            sys.exit(1)
     def init_table(self):
         self.TableHeaders=['二维码',' 板厚图片 ',' 确认结果 ']
-        self.tableModel=ImagesTableModel([],self.TableHeaders)
+        self.TableResetRows=64     # 一次更新的行数超过该数量时重新设置整个表格
+        self.tableModel=ImagesTableModel(self.TableHeaders)
         self.ui.tblImages.setModel(self.tableModel)
+        self.data = self.tableModel.keys
         header = self.ui.tblImages.horizontalHeader()
         header.setSectionResizeMode(0,QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(1,QHeaderView.ResizeMode.ResizeToContents)
         header.setSectionResizeMode(2,QHeaderView.ResizeMode.ResizeToContents)
 
     def init_thread(self):
+        # 标记删除的测量文件夹在后台删除，需在启动监控线程前创建，失败时退出
+        try:
+            self.deleteQueue = DeleteQueue(os.path.join(self.config["ImagesFolder"], TRASH_NAME), threads=int(self.config["DeleteThreads"]), parent=self)
+        except OSError as e:
+            QMessageBox.critical(self, "配置文件错误", f"无法创建回收文件夹:\n{e}")
+            sys.exit(1)
+        self.deleteQueue.error_occurred.connect(self.error_occurred)
+        self.deleteQueue.resume()
+
+        self.lblQueue = QLabel()
+        self.ui.statusbar.addPermanentWidget(self.lblQueue)
+        self.pendingUpdates = {}    # 等待处理的缩略图状态更新 {(dir,name): status}
+        self.updateTimer = QTimer(self)
+        self.updateTimer.setSingleShot(True)
+        self.updateTimer.setInterval(100)
+        self.updateTimer.timeout.connect(self.apply_thumbnail_updates)
         self.thread = QThread()
-        self.worker = MonitorDir(self.config["ImagesFolder"], self.config["ThumbnailFolder"])
+        self.thumbnailCache = ImageCache(int(self.config["ThumbnailCacheMB"]) * 1024 * 1024)
+        self.pixmapCache = ImageCache(int(self.config["PixmapCacheMB"]) * 1024 * 1024)
+        self.thumbnailLoader = ThumbnailLoader(parent=self)
+        self.thumbnailLoader.loaded.connect(self.thumbnail_loaded)
+        self.worker = MonitorDir(
+            self.config["ImagesFolder"],
+            self.config["ThumbnailFolder"],
+            workers=int(self.config["RenderWorkers"]),
+            threads=int(self.config["DecodeThreads"]),
+            watch=bool(self.config["FileWatcher"]),
+            watch_interval=int(self.config["WatcherPollInterval"]),
+            settle_time=int(self.config["SettleTime"]),
+            thumbnail_format=self.config["ThumbnailFormat"],
+            thumbnail_quality=int(self.config["ThumbnailQuality"]),
+            thumbnail_compression=int(self.config["ThumbnailCompression"]),
+            image_cache=self.thumbnailCache
+        )
         self.worker.moveToThread(self.thread)
         self.worker.dir_updated.connect(self.dir_updated)
-        self.worker.thumbnail_updated.connect(self.thumbnail_updated)
+        self.worker.thumbnails_updated.connect(self.thumbnails_updated)
         self.worker.error_occurred.connect(self.error_occurred)
+        self.worker.queue_changed.connect(self.queue_changed)
         self.thread.started.connect(self.worker.start_monitor)
         self.thread.start()
+
+        # 发送型号数据至待处理文件夹的后台任务
+        self.transferThread = None
+        self.transferJob = None
+        self.prgTransfer = QProgressBar()
+        self.prgTransfer.setMaximumWidth(240)
+        self.prgTransfer.setVisible(False)
+        self.btnCancelTransfer = QPushButton("取消发送")
+        self.btnCancelTransfer.setVisible(False)
+        self.btnCancelTransfer.clicked.connect(self.cancel_transfer)
+        self.ui.statusbar.addPermanentWidget(self.prgTransfer)
+        self.ui.statusbar.addPermanentWidget(self.btnCancelTransfer)
         
     def init_signal(self):
         self.ui.cmbSelectPN.currentIndexChanged.connect(self.selected_pn_changed)
@@ -126,6 +266,12 @@ class MainWindow(QMainWindow):
         
 
     def closeEvent(self, event):
+        if self.transferJob is not None:
+            self.transferJob.stop()
+            self.transferThread.quit()
+            self.transferThread.wait()
+        self.thumbnailLoader.shutdown()
+        self.deleteQueue.shutdown()
         self.worker.stop()
         self.thread.quit()
         if not self.thread.wait(3000):  # 等待3秒
@@ -135,24 +281,22 @@ class MainWindow(QMainWindow):
 
 
     def move_todo(self):
+        if self.transferJob is not None:
+            QMessageBox.warning(self, "错误", "正在发送其他型号的数据，请等待完成后再发送！")
+            return
         self.mutex.lock()
         for dir,name in self.data:
-            checked=self.images[(dir,name)]["checked"]
-            if checked==self.status['error'] or checked=="":
+            if self.images[(dir,name)].decision == Decision.NONE:
                 self.mutex.unlock()
                 QMessageBox.warning(self, "错误", "有未确认的板厚图片，请先标记所有待处理的板厚图片！")
                 return
         
+        deletes = []
         for dir,name in self.data:
-            checked=self.images[(dir,name)]["checked"]
-            if checked==self.status['delete']:
-                try:
-                    shutil.rmtree(os.path.join(self.config["ImagesFolder"], dir, name))
-                except Exception as e:
-                    self.mutex.unlock()
-                    QMessageBox.critical(self, "错误", f"无法删除指定的文件夹:\n{e}")
-                    return
-            elif checked==self.status['section']:
+            decision=self.images[(dir,name)].decision
+            if decision == Decision.DELETE:
+                deletes.append(os.path.join(self.config["ImagesFolder"], dir, name))
+            elif decision == Decision.SECTION:
                 try:
                     if not os.path.isdir(os.path.join(self.config["SectionFolder"], dir)):
                         os.mkdir(os.path.join(self.config["SectionFolder"], dir))
@@ -162,19 +306,56 @@ class MainWindow(QMainWindow):
                     self.mutex.unlock()
                     QMessageBox.critical(self, "错误", f"无法输出切片板信息至指定路径:\n{e}")
                     return
-                
-        try:
-            dir = self.ui.cmbSelectPN.currentText()
-            shutil.move(os.path.join(self.config["ImagesFolder"], dir), os.path.join(self.config["ProcessFolder"], dir))
-        except Exception as e:
-            self.mutex.unlock()
-            QMessageBox.critical(self, "错误", f"无法移动当前型号数据至待处理文件夹:\n{e}")
-            return
         self.mutex.unlock()
-        QMessageBox.information(self, "成功", f"已将 {dir} 数据移发送至板厚分析待处理！")
-    
 
+        # 删除和移动文件在后台进行，期间可以继续确认其他型号的图片
+        dir = self.ui.cmbSelectPN.currentText()
+        self.transferThread = QThread()
+        self.transferJob = TransferJob(
+            os.path.join(self.config["ImagesFolder"], dir),
+            os.path.join(self.config["ProcessFolder"], dir),
+            deletes,
+            streams=int(self.config["TransferStreams"]),
+            delete_queue=self.deleteQueue
+        )
+        self.transferJob.moveToThread(self.transferThread)
+        self.transferJob.progress.connect(self.transfer_progress)
+        self.transferJob.finished.connect(self.transfer_finished)
+        self.transferJob.error_occurred.connect(self.error_occurred)
+        self.transferThread.started.connect(self.transferJob.run)
+        self.prgTransfer.setRange(0, 0)
+        self.prgTransfer.setFormat(f"发送 {dir}")
+        self.prgTransfer.setVisible(True)
+        self.btnCancelTransfer.setEnabled(True)
+        self.btnCancelTransfer.setVisible(True)
+        self.ui.btnMoveTodo.setEnabled(False)
+        self.transferThread.start()
+
+    @Slot()
+    def cancel_transfer(self):
+        if self.transferJob is None: return
+        self.transferJob.stop()
+        self.btnCancelTransfer.setEnabled(False)
+
+    @Slot(str, int, int)
+    def transfer_progress(self, step:str, done:int, total:int):
+        self.prgTransfer.setRange(0, total)
+        self.prgTransfer.setValue(done)
+        self.prgTransfer.setFormat(f"{step} %v / %m")
 
+    @Slot(str, str)
+    def transfer_finished(self, dir:str, status:str):
+        self.transferThread.quit()
+        self.transferThread.wait()
+        self.transferThread = None
+        self.transferJob = None
+        self.prgTransfer.setVisible(False)
+        self.btnCancelTransfer.setVisible(False)
+        self.ui.btnMoveTodo.setEnabled(True)
+        if status == "ok":
+            QMessageBox.information(self, "成功", f"已将 {dir} 数据移发送至板厚分析待处理！")
+        elif status == "cancel":
+            QMessageBox.information(self, "提示", f"已取消发送 {dir} 数据，再次发送时将继续复制未完成的文件。")
 
     def mark_ok(self):
         self.mutex.lock()
@@ -185,17 +366,17 @@ class MainWindow(QMainWindow):
             return
         try:
             dir,name = self.data[idx]
-            if self.images[(dir,name)]["status"]!=self.status['ok']:
+            if self.images[(dir,name)].status != Status.OK:
                 self.mutex.unlock()
                 QMessageBox.warning(self, "错误", "请等待当前图片缩略图生成完成！")
                 return
-            self.images[(dir,name)]["checked"] = self.status['ok']
+            self.images[(dir,name)].decision = Decision.OK
         except Exception as e:
             self.mutex.unlock()
             QMessageBox.critical(self, "错误", f"无法确认当前图片:\n{e}")
             return
         self.mutex.unlock()
-        self.update_table()
+        self.update_table_row(dir,name)
         self.select_next_unchecked_image()
 
     def mark_section(self):
@@ -207,16 +388,16 @@ class MainWindow(QMainWindow):
             return
         try:
             dir,name = self.data[idx]
-            if self.images[(dir,name)]["status"]!=self.status['ok']:
+            if self.images[(dir,name)].status != Status.OK:
                 self.mutex.unlock()
                 QMessageBox.warning(self, "错误", "请等待当前图片缩略图生成完成！")
                 return
-            self.images[(dir,name)]["checked"] = self.status['section']
+            self.images[(dir,name)].decision = Decision.SECTION
         except Exception as e:
             self.mutex.unlock()
             QMessageBox.critical(self, "错误", f"无法确认当前图片:\n{e}")
         self.mutex.unlock()
-        self.update_table()
+        self.update_table_row(dir,name)
         self.select_next_unchecked_image()
 
     def mark_delete(self):
@@ -228,45 +409,60 @@ class MainWindow(QMainWindow):
             return
         try:
             dir,name = self.data[idx]
-            if self.images[(dir,name)]["status"]!=self.status['ok']:
+            if self.images[(dir,name)].status != Status.OK:
                 self.mutex.unlock()
                 QMessageBox.warning(self, "错误", "请等待当前图片缩略图生成完成！")
                 return
-            self.images[(dir,name)]["checked"] = self.status['delete']
+            self.images[(dir,name)].decision = Decision.DELETE
         except Exception as e:
             self.mutex.unlock()
             QMessageBox.critical(self, "错误", f"无法确认当前图片:\n{e}")
         self.mutex.unlock()
-        self.update_table()
+        self.update_table_row(dir,name)
         self.select_next_unchecked_image()
 
     @Slot()
     def selected_pn_changed(self):
         self.currentIndex = -1
+        self.worker.set_priority(self.ui.cmbSelectPN.currentText())
         self.update_table()
         self.clear_current_image()
 
+    def table_row(self, dir, name):
+        # 生成表格中一行的数据
+        image = self.images[(dir,name)]
+        return [image.matrix,self.statusText[image.status],self.decisionText[image.decision]]
+
     def update_table(self):
         # 根据当前选择的型号更新表格数据
-        folder_regex = re.compile(r"^([A-Z0-9\-]+)_(\d+)_(\d{14})_(\d*)_.*$",re.IGNORECASE)
         select_dir = self.ui.cmbSelectPN.currentText()
         with QMutexLocker(self.mutex):
             try:
-                self.data = [(dir,name) for dir,name in self.images.keys() if dir == select_dir]
-                self.data.sort(key=lambda x: x[1])
-                tableData=[]
-                for i,info in enumerate(self.data):
-                    dir,name = info
-                    match = folder_regex.match(name)
-                    if match:
-                        matrix = match.group(4)
-                    else:
-                        matrix = ""
-                    image = self.images[(dir,name)]
-                    tableData.append([matrix,image["status"],image['checked']])
-            
-                self.tableModel=ImagesTableModel(tableData,self.TableHeaders)
-                self.ui.tblImages.setModel(self.tableModel)
+                keys = [(select_dir,name) for name in self.dirImages.get(select_dir, [])]
+                self.tableModel.reset_rows(keys, [self.table_row(dir,name) for dir,name in keys])
+            except Exception as e:
+                QMessageBox.critical(self, "错误", f"无法更新当前图片列表数据:\n{e}")
+
+    def add_index(self, dir, name):
+        bisect.insort(self.dirImages.setdefault(dir, []), name)
+
+    def remove_index(self, dir, name):
+        names = self.dirImages.get(dir, [])
+        idx = bisect.bisect_left(names, name)
+        if idx < len(names) and names[idx] == name:
+            del names[idx]
+        if not names:
+            self.dirImages.pop(dir, None)
+
+    def update_table_row(self, dir, name):
+        # 只更新表格中一张图片所在的行
+        if self.ui.cmbSelectPN.currentText() != dir: return
+        with QMutexLocker(self.mutex):
+            try:
+                if (dir,name) in self.images:
+                    self.tableModel.set_row((dir,name), self.table_row(dir,name))
+                else:
+                    self.tableModel.remove_row((dir,name))
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"无法更新当前图片列表数据:\n{e}")
 
@@ -293,11 +489,14 @@ class MainWindow(QMainWindow):
         if not dir: return
         with QMutexLocker(self.mutex):
             try:
-                if (dir,name) in self.data:
-                    idx = self.data.index((dir,name))
+                idx = self.tableModel.row_of((dir,name))
+                if idx >= 0:
                     target_index = self.tableModel.index(idx,0)
                     self.ui.tblImages.setCurrentIndex(target_index)
                     self.ui.tblImages.selectRow(idx)
+                    # 缩略图还未生成时优先生成当前查看的图片
+                    if self.images[(dir,name)].status != Status.OK:
+                        self.worker.set_priority(dir, name)
                 else:
                     idx = -1
                     self.ui.tblImages.clearFocusr()
@@ -308,22 +507,12 @@ class MainWindow(QMainWindow):
         self.show_selected_image()
 
     def select_next_unchecked_image(self):
+        # 选择当前图片之后的下一张未确认图片
         dir,name = self.get_current_image()
         with QMutexLocker(self.mutex):
-            idx=self.currentIndex
-            length = len(self.data)
-            unchecked = False
-            if idx<0 or length==0 or idx>=length:
-                unchecked = True
-            else:
-                for i,info in enumerate(self.data):
-                    dir,name = info
-                    if not self.images[(dir,name)]["checked"]:
-                        self.currentIndex = idx
-                        unchecked = True
-                        break
-        if unchecked:
-            self.select_table_row(dir,name)
+            key = self.tableModel.next_unchecked((dir,name))
+        if key is not None:
+            self.select_table_row(*key)
         else:
             QMessageBox.information(self, "提示", "所有图片已确认，可将数据发送至板厚分析电脑。")
             self.clear_current_image()
@@ -333,6 +522,52 @@ class MainWindow(QMainWindow):
         self.ui.lblComment.setText("")
         self.ui.imgCS.setPixmap(QPixmap())
         self.ui.imgSS.setPixmap(QPixmap())
+        for key in self.currentThumbnails:
+            self.thumbnailLoader.cancel(key)
+        self.currentThumbnails = {}
+
+    def request_thumbnail(self, dir, name, variant, size, priority=0):
+        # 在后台读取并缩放缩略图，完成后放入缓存，返回缓存的键
+        # 优先使用监控线程刚生成的缩略图，不在缓存中时从缩略图文件夹读取
+        key = (dir, name, variant, size.width(), size.height())
+        if self.pixmapCache.get(key) is not None or key in self.thumbnailLoader: return key
+        path = os.path.join(self.config["ThumbnailFolder"], dir, thumbnail_file(name, variant, self.config["ThumbnailFormat"]))
+        self.thumbnailLoader.load(key, path, size, self.thumbnailCache.get((dir, name, variant)), priority)
+        return key
+
+    def show_thumbnail(self, label, dir, name, variant):
+        # 缓存中有缩放好的缩略图时直接显示，否则在后台读取完成后再显示
+        key = self.request_thumbnail(dir, name, variant, label.size(), priority=1)
+        self.currentThumbnails[key] = label
+        pixmap = self.pixmapCache.get(key)
+        label.setPixmap(pixmap if pixmap is not None else QPixmap())
+        return key
+
+    def prefetch_thumbnails(self):
+        # 预读接下来待确认的几张图片，确认后切换到下一张时不需要等待读取
+        count = int(self.config["PrefetchCount"])
+        if count <= 0: return
+        rows = []
+        with QMutexLocker(self.mutex):
+            current = self.data[self.currentIndex] if 0 <= self.currentIndex < len(self.data) else ("","")
+            for info in self.tableModel.iter_unchecked(current):
+                if len(rows) >= count: break
+                if self.images[info].status == Status.OK:
+                    rows.append(info)
+        for dir,name in rows:
+            self.request_thumbnail(dir, name, "CS", self.ui.imgCS.size())
+            self.request_thumbnail(dir, name, "SS", self.ui.imgSS.size())
+
+    @Slot(object, int, QImage)
+    def thumbnail_loaded(self, key, token:int, image:QImage):
+        if not self.thumbnailLoader.finish(key, token): return
+        if image.isNull(): return
+        pixmap = QPixmap.fromImage(image)
+        self.pixmapCache.put(key, pixmap)
+        # 只有仍是当前选中的图片时才显示
+        label = self.currentThumbnails.get(key)
+        if label is not None:
+            label.setPixmap(pixmap)
 
     def show_selected_image(self):
         self.mutex.lock()
@@ -346,31 +581,27 @@ class MainWindow(QMainWindow):
             try:
                 dir,name = self.data[idx]
                 info=self.images[(dir,name)]
-                status = info["status"]
-                checked = info["checked"]
+                status = info.status
+                checked = self.decisionText[info.decision]
             finally:
                 self.mutex.unlock()
+            previous = self.currentThumbnails
+            self.currentThumbnails = {}
             try:
                 self.ui.lblTitle.setText("{} {}".format(checked,name))
                 self.ui.lblComment.setText("{} / {}".format(idx+1,length))
-                if status == self.status["ok"]:
-                    imgCS = QPixmap(os.path.join(self.config["ThumbnailFolder"], dir, name+"_CS.png")).scaled(
-                        self.ui.imgCS.size(), 
-                        Qt.KeepAspectRatio,  # 保持宽高比
-                        Qt.SmoothTransformation  # 平滑缩放
-                    )
-                    imgSS = QPixmap(os.path.join(self.config["ThumbnailFolder"], dir, name+"_SS.png")).scaled(
-                        self.ui.imgSS.size(), 
-                        Qt.KeepAspectRatio,  # 保持宽高比
-                        Qt.SmoothTransformation  # 平滑缩放
-                    )
-                    self.ui.imgCS.setPixmap(imgCS)
-                    self.ui.imgSS.setPixmap(imgSS)
+                if status == Status.OK:
+                    self.show_thumbnail(self.ui.imgCS, dir, name, "CS")
+                    self.show_thumbnail(self.ui.imgSS, dir, name, "SS")
                 else:
                     self.ui.imgCS.setPixmap(QPixmap())
                     self.ui.imgSS.setPixmap(QPixmap())
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"无法载入缩略图：{e}")
+            # 取消上一次选中图片还未完成的读取
+            for key in previous.keys() - self.currentThumbnails.keys():
+                self.thumbnailLoader.cancel(key)
+            self.prefetch_thumbnails()
 
 
     @Slot(list)
@@ -393,40 +624,71 @@ class MainWindow(QMainWindow):
         if dir_changed:
             self.selected_pn_changed()
 
-    @Slot(str, str)
-    def thumbnail_updated(self, dir:str, name:str, status:str):
+    @Slot(list)
+    def thumbnails_updated(self, updates:list):
+        # 合并短时间内收到的更新，由定时器统一处理，同一图片只保留最后的状态
+        for dir,name,status in updates:
+            self.pendingUpdates[(dir,name)] = status
+        if not self.updateTimer.isActive():
+            self.updateTimer.start()
+
+    def apply_thumbnail_updates(self):
+        updates, self.pendingUpdates = self.pendingUpdates, {}
+        current_dir,current_name = self.get_current_image()
+        select_dir = self.ui.cmbSelectPN.currentText()
+        changed = []        # 当前型号中有变化的图片
+
         # 更新收集的图片信息
         with QMutexLocker(self.mutex):
-            current_dir = self.ui.cmbSelectPN.currentText()
-            try:
-                if status == "ok":
-                    if (dir,name) in self.images:
-                        self.images[(dir,name)]["status"] = self.status[status]
-                    else:
-                        self.images[(dir,name)] = {"status": self.status[status], "checked": ""}
-                elif status == "error":
-                    if (dir,name) in self.images:
-                        self.images[(dir,name)]["status"] = self.status[status]
-                    else:
-                        self.images[(dir,name)] = {"status": self.status[status], "checked": ""}
-                elif status == "delete":
-                    if (dir,name) in self.images:
-                        del self.images[(dir,name)]
-                elif status == "new":
-                    self.images[(dir,name)] = {"status": "", "checked": ""}
-            except Exception as e:
-                QMessageBox.critical(self, "错误", f"无法更新图片信息：{e}")
+            for (dir,name),status in updates.items():
+                # 缩略图重新生成或已删除时，缓存中的缩放结果已失效
+                if status in ("ok", "delete"):
+                    self.pixmapCache.discard((dir, name))
+                    self.thumbnailLoader.cancel((dir, name))
+                try:
+                    if status == "ok" or status == "error":
+                        if (dir,name) not in self.images:
+                            self.images[(dir,name)] = FolderRecord(dir,name)
+                            self.add_index(dir,name)
+                        self.images[(dir,name)].status = Status.OK if status == "ok" else Status.ERROR
+                    elif status == "delete":
+                        if (dir,name) in self.images:
+                            del self.images[(dir,name)]
+                            self.remove_index(dir,name)
+                    elif status == "new":
+                        if (dir,name) not in self.images:
+                            self.add_index(dir,name)
+                        self.images[(dir,name)] = FolderRecord(dir,name)
+                except Exception as e:
+                    QMessageBox.critical(self, "错误", f"无法更新图片信息：{e}")
+                if dir == select_dir:
+                    changed.append((dir,name))
+        if not changed: return
 
-        # 如果更新的数据为当前选择的型号，则更新表格
-        if self.ui.cmbSelectPN.currentText() == dir:
+        # 如果更新的数据为当前选择的型号，变化较少时只更新对应的行，否则一次更新整个表格
+        if len(changed) > self.TableResetRows:
             self.update_table()
+            self.select_table_row(current_dir,current_name)
+            return
+        length = len(self.data)
+        for dir,name in changed:
+            self.update_table_row(dir,name)
 
-        current_dir,current_name = self.get_current_image()
-        if current_dir == dir:
+        # 插入或删除行后当前图片的行号会变化，新的测量文件夹也可能以 ok/error 状态插入，始终按名称重新查找
+        with QMutexLocker(self.mutex):
+            self.currentIndex = self.tableModel.row_of((current_dir,current_name)) if current_dir else -1
+        if (current_dir,current_name) in updates or len(self.data) != length:
             self.show_selected_image()
-            self.select_table_row(current_dir,current_name)
 
 
+    @Slot(int)
+    def queue_changed(self, count:int):
+        # 显示等待生成缩略图的数量
+        if count > 0:
+            self.lblQueue.setText(f"待生成缩略图：{count}")
+        else:
+            self.lblQueue.setText("")
+
     @Slot(str)
     def error_occurred(self, error:str):
         QMessageBox.critical(self, "错误", error)
@@ -434,6 +696,7 @@ class MainWindow(QMainWindow):
 
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()    # 打包后使用进程池时需要
     app = QApplication([])
     app.setStyle(QStyleFactory.create("Fusion"))
     win = MainWindow()
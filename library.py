@@ -1,22 +1,291 @@
-from PySide6.QtGui import QImage, QPainter
-from PySide6.QtCore import Qt, Signal, Slot, QObject
+from PySide6.QtGui import QImage, QImageReader, QImageWriter, QImageIOHandler, QPainter
+from PySide6.QtCore import Qt, Signal, Slot, QObject, QRect, QSize, QCoreApplication, QEventLoop, QFileSystemWatcher, QTimer, QThreadPool
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from enum import IntEnum
+import multiprocessing
+import threading
+import shutil
+import errno
+import heapq
+import json
 import os
 import time
 import re
 
+# 测量文件夹名称格式：料号_批次_时间_二维码_其他
+FOLDER_REGEX = re.compile(r"^([A-Z0-9\-]+)_(\d+)_(\d{14})_(\d*)_.*$",re.IGNORECASE)
+
+# 缩略图缓存清单文件名，保存在缩略图目录的每个型号文件夹中
+MANIFEST_NAME = "manifest.json"
+
+# 等待后台删除的文件夹存放位置，位于监控文件夹中，扫描时跳过以 . 开头的文件夹
+TRASH_NAME = ".trash"
+
+# 支持的缩略图格式及对应的文件扩展名，bmp 为不压缩格式
+THUMBNAIL_FORMATS = {"png": "png", "jpg": "jpg", "jpeg": "jpg", "webp": "webp", "bmp": "bmp"}
+
+# 红色通道阈值映射表，大于10的值映射为1，其余为0
+RED_THRESHOLD_TABLE = bytes(1 if value > 10 else 0 for value in range(256))
+
+class Status(IntEnum):
+    """缩略图生成状态"""
+    NONE = 0
+    OK = 1
+    ERROR = 2
+
+
+class Decision(IntEnum):
+    """人工确认结果"""
+    NONE = 0
+    OK = 1
+    SECTION = 2
+    DELETE = 3
+
+
+class FolderRecord:
+    """
+    测量文件夹的状态记录，监控线程和界面共用
+    名称中的料号、批次、时间和二维码在创建时解析一次
+    """
+    __slots__ = ("dir", "name", "part", "lot", "timestamp", "matrix", "mtime", "signature", "status", "decision")
+
+    def __init__(self, dir, name, mtime=0, signature=None, status=Status.NONE, decision=Decision.NONE):
+        self.dir = dir
+        self.name = name
+        match = FOLDER_REGEX.match(name)
+        if match:
+            self.part, self.lot, self.timestamp, self.matrix = match.groups()
+        else:
+            self.part = self.lot = self.timestamp = self.matrix = ""
+        self.mtime = mtime              # 上次生成缩略图时测量文件夹的修改时间
+        self.signature = signature      # 上次生成缩略图时的数据签名
+        self.status = status
+        self.decision = decision
+
+
+class ImageCache:
+    """
+    线程安全的 LRU 图片缓存，按图片占用的字节数限制容量
+    可以缓存 QImage 或 QPixmap，键为元组，可按键的前缀批量删除
+    """
+    def __init__(self, max_bytes):
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.max_bytes = max_bytes
+        self.size = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def cost(self, image):
+        return image.width() * image.height() * image.depth() // 8
+
+    def get(self, key):
+        """获取缓存的图片，不存在时返回 None"""
+        with self.lock:
+            image = self.items.get(key)
+            if image is not None:
+                self.items.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        with self.lock:
+            if key in self.items:
+                self.size -= self.cost(self.items.pop(key))
+            cost = self.cost(image)
+            if cost > self.max_bytes: return
+            self.items[key] = image
+            self.size += cost
+            while self.size > self.max_bytes:
+                old_key, old_image = self.items.popitem(last=False)
+                self.size -= self.cost(old_image)
+
+    def discard(self, prefix):
+        """删除键以 prefix 开头的所有图片"""
+        with self.lock:
+            for key in [key for key in self.items if key[:len(prefix)] == prefix]:
+                self.size -= self.cost(self.items.pop(key))
+
+
+class ThumbnailLoader(QObject):
+    """
+    在线程池中读取并缩放缩略图，完成后通过 loaded 信号返回 QImage
+    请求以元组为键，每次请求分配一个序号，取消后的请求不再读取，
+    已读取的结果在 finish 时按序号核对，取消后再次请求同一键时，旧请求的结果也会被丢弃
+    """
+    loaded = Signal(object, int, QImage)     # key, 请求序号, 图片
+
+    def __init__(self, threads=2, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(threads)
+        self.lock = threading.Lock()
+        self.pending = {}       # 等待完成的请求，{key: 请求序号}
+        self.generation = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.pending
+
+    def load(self, key, path, size, image=None, priority=0):
+        """
+        读取 path 的图片并按比例缩放到 size 以内
+        image 不为空时直接缩放该图片，不再读取文件
+        """
+        with self.lock:
+            if key in self.pending: return
+            self.generation += 1
+            token = self.pending[key] = self.generation
+        self.pool.start(lambda: self.run(key, token, path, size, image), priority)
+
+    def cancel(self, prefix=()):
+        """取消键以 prefix 开头的请求"""
+        with self.lock:
+            self.pending = {key: token for key, token in self.pending.items() if key[:len(prefix)] != prefix}
+
+    def is_current(self, key, token):
+        with self.lock:
+            return self.pending.get(key) == token
+
+    def finish(self, key, token):
+        """在接收 loaded 信号的线程中调用，请求已被取消或已被新的请求替代时返回 False"""
+        with self.lock:
+            if self.pending.get(key) != token: return False
+            del self.pending[key]
+            return True
+
+    def shutdown(self):
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def run(self, key, token, path, size, image):
+        if not self.is_current(key, token): return
+        try:
+            if image is None:
+                reader = QImageReader(path)
+                source_size = reader.size()
+                if source_size.isValid():
+                    reader.setScaledSize(source_size.scaled(size, Qt.KeepAspectRatio))
+                image = reader.read()
+            else:
+                image = image.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        except Exception:
+            image = QImage()
+        self.loaded.emit(key, token, image)
+
+
+class RenderQueue:
+    """
+    待生成缩略图的测量文件夹队列，默认按型号、名称顺序出队
+    可以指定优先处理的型号，以及插队到最前面的测量文件夹
+    已在队列中的测量文件夹不会重复加入，删除时只做标记，出队时跳过
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.heaps = {}             # 每个型号的测量文件夹名称最小堆，{dir: [name]}
+        self.items = set()
+        self.priority_dir = None    # 优先处理的型号
+        self.urgent = None          # 最先处理的测量文件夹 (dir, name)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def push(self, key):
+        with self.lock:
+            if key in self.items: return
+            self.items.add(key)
+            dir, name = key
+            heapq.heappush(self.heaps.setdefault(dir, []), name)
+
+    def discard(self, key):
+        with self.lock:
+            self.items.discard(key)
+
+    def set_priority(self, dir, name=None):
+        """设置优先处理的型号，name 不为空时该测量文件夹排在最前面"""
+        with self.lock:
+            self.priority_dir = dir or None
+            self.urgent = (dir, name) if dir and name else None
+
+    def pop(self):
+        """取出下一个测量文件夹，队列为空时返回 None"""
+        with self.lock:
+            if self.urgent in self.items:
+                key = self.urgent
+                self.items.remove(key)
+                self.urgent = None
+                return key
+            if self.priority_dir in self.heaps:
+                key = self.pop_dir(self.priority_dir)
+                if key is not None: return key
+            for dir in sorted(self.heaps):
+                key = self.pop_dir(dir)
+                if key is not None: return key
+            return None
+
+    def pop_dir(self, dir):
+        """取出指定型号中名称最小的测量文件夹，需要在加锁后调用"""
+        heap = self.heaps[dir]
+        key = None
+        while heap:
+            name = heapq.heappop(heap)
+            if (dir, name) in self.items:
+                key = (dir, name)
+                self.items.remove(key)
+                break
+        if not heap:
+            del self.heaps[dir]
+        return key
+
+
 class MonitorDir(QObject):
     # 定义线程间通信信号
     dir_updated = Signal(list)
-    thumbnail_updated = Signal(str, str, str)      # dir, name, status(ok,error,delete)
+    thumbnails_updated = Signal(list)              # [(dir, name, status(new,ok,error,delete))]
     error_occurred = Signal(str)
+    queue_changed = Signal(int)                    # 等待生成缩略图的测量文件夹数量
+
+    # 生成缩略图的参数，变化后已有的缩略图需要重新生成
+    render_options = {"overlay": 65, "top_ignore": 520, "scale": 0.05, "crop_threshold": 0.8}
     
-    def __init__(self, monitor_path, thumbnail_path, interval=5):
+    def __init__(self, monitor_path, thumbnail_path, interval=5, workers=0, threads=0, watch=False, watch_interval=60, settle_time=0,
+                 thumbnail_format="png", thumbnail_quality=-1, thumbnail_compression=-1, image_cache=None):
         super().__init__()
         self.monitor_path = monitor_path
         self.thumbnail_path = thumbnail_path
         self.dirs = []
-        self.images = {}
+        self.images = {}            # 已处理的测量文件夹，{(dir, name): FolderRecord}
         self.interval = interval
+        self.workers = workers      # 生成缩略图的进程数量，0 表示在当前线程中生成
+        self.pool = None
+        self.threads = threads      # 单个文件夹内并行解码和拼接图片的线程数量，0 表示依次处理
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self.manifest = {}          # 缩略图缓存清单，{dir: {name: {"signature": 数据签名, "options": 生成参数}}}
+        self.manifest_dirty = set() # 需要保存清单的型号文件夹
+        self.watch = watch          # 是否使用文件夹变化事件触发扫描
+        self.watch_interval = watch_interval    # 使用文件夹变化事件时，兜底轮询扫描的间隔
+        self.watcher = None
+        self.wait_loop = None
+        self.changed_paths = set()  # 收到变化事件的文件夹
+        self.dir_mtimes = {}        # 型号文件夹上次列举时的修改时间，{dir: mtime}
+        self.dir_entries = {}       # 型号文件夹中的测量文件夹，{dir: {name: mtime}}
+        self.queue = RenderQueue()  # 需要生成缩略图的测量文件夹队列
+        self.futures = {}           # 进程池中正在生成缩略图的任务，{future: (dir, name)}
+        self.crashed = set()        # 子进程意外退出时正在生成、已重新加入队列一次的测量文件夹
+        self.unsettled = {}         # 生成缩略图出错的测量文件夹，可能仍在写入数据，{(dir, name): 出错时的写入签名}
+        self.settle_time = settle_time      # 测量文件夹数据保持不变多少秒后才生成缩略图
+        self.settling = {}          # 等待数据写入完成的测量文件夹，{(dir, name): (签名, 签名开始保持不变的时间)}
+        self.thumbnail_format = THUMBNAIL_FORMATS[thumbnail_format.lower()]
+        self.thumbnail_quality = thumbnail_quality          # JPEG/WebP 图片质量 0~100，-1 表示默认值
+        self.thumbnail_compression = thumbnail_compression  # PNG 压缩级别 0~9，-1 表示默认值
+        self.image_cache = image_cache      # 与界面共享的缩略图缓存，{(dir, name, "CS"/"SS"): QImage}
+        self.updates = []           # 等待发送的缩略图状态更新，[(dir, name, status)]
         self._stop = False
         
     @Slot()
@@ -27,7 +296,7 @@ class MonitorDir(QObject):
         self.dirs = []
         try:
             for entry in os.scandir(self.monitor_path):
-                if entry.is_dir():
+                if entry.is_dir() and not entry.name.startswith("."):
                     self.dirs.append(entry.name)
             self.dirs.sort()
             self.dir_updated.emit(self.dirs)
@@ -36,194 +305,698 @@ class MonitorDir(QObject):
 
 
         # 搜索子文件夹中的测量图片
-        folder_regex = re.compile(r"^([A-Z0-9\-]+)_(\d+)_(\d{14})_(\d*)_.*$",re.IGNORECASE)
+        folder_regex = FOLDER_REGEX
         try:
+            self.scan_dirs(folder_regex)
+            for dir in self.dirs:
+                for name in sorted(self.dir_entries.get(dir, {})):
+                    self.post_update(dir, name, "new")
+            # 先把文件夹列表交给界面，再逐个校验缩略图缓存清单
+            self.flush_updates()
             for dir in self.dirs:
-                for entry in os.scandir(os.path.join(self.monitor_path, dir)):
-                    if entry.is_dir():
-                        name = entry.name
-                        match = folder_regex.match(name)
-                        if match:
-                            self.thumbnail_updated.emit(dir, name, "new")
+                for name, mtime in sorted(self.dir_entries.get(dir, {}).items()):
+                    # 缩略图缓存清单中数据签名一致时，直接使用已有的缩略图
+                    if self.is_thumbnail_current(dir, name):
+                        signature = self.manifest[dir][name]["signature"]
+                        self.images[(dir, name)] = FolderRecord(dir, name, mtime, signature, Status.OK)
+                        self.queue.discard((dir, name))
+                        self.settling.pop((dir, name), None)
+                        self.post_update(dir, name, "ok")
         except:
             pass
+        self.flush_updates()
+
 
+        # 监控文件夹变化事件，需要在有事件循环的线程中运行
+        if self.watch and QCoreApplication.instance() is not None:
+            self.watcher = QFileSystemWatcher()
+            self.watcher.directoryChanged.connect(self.directory_changed)
+            self.update_watcher()
 
-        # 监控文件夹内图片文件变化
+        # 监控文件夹内图片文件变化，进程池模式下由多个子进程同时生成缩略图
+        if self.workers > 0:
+            self.create_pool()
+        try:
+            self.monitor_loop(folder_regex)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = None
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+            if self.watcher is not None:
+                self.watcher.deleteLater()
+                self.watcher = None
+            self.save_manifests()
+
+    def monitor_loop(self, folder_regex):
+        """
+        监控文件夹内图片文件变化
+        扫描时将新增或修改过的测量文件夹加入队列，队列不为空时持续生成缩略图，
+        生成过程中每隔 interval 秒或收到文件夹变化事件时重新扫描一次
+        """
+        next_scan = 0
         while not self._stop:
-            # 判断监控文件夹是否有新型号
-            current_dirs = []
+            if time.time() >= next_scan or self.changed_paths:
+                self.changed_paths.clear()
+                self.scan(folder_regex)
+                self.flush_updates()
+                self.save_manifests()
+                next_scan = time.time() + self.interval
+
+            # 创建图片文件
+            if self.queue or self.futures:
+                try:
+                    if self.pool is not None:
+                        self.render_with_pool()
+                    else:
+                        self.render_next()
+                except Exception as e:
+                    pass
+                self.flush_updates()
+                if self.watcher is not None:
+                    QCoreApplication.processEvents()    # 接收生成缩略图期间的文件夹变化事件
+                if self.queue or self.futures:
+                    continue
+                self.save_manifests()
+
+            if self.interval == 0: return
+            # 队列为空时休眠，文件夹变化事件可用时等待事件，并按较长的间隔兜底扫描，
+            # 有等待数据写入完成的测量文件夹时按 interval 间隔检查
+            if self.is_watching() and not self.settling:
+                self.wait_for_changes(self.watch_interval)
+            else:
+                self.wait_for_changes(self.interval)
+            next_scan = 0
+
+    def scan(self, folder_regex):
+        """扫描型号和测量文件夹，更新缩略图生成队列"""
+        # 判断监控文件夹是否有新型号
+        current_dirs = []
+        vanished = []       # 已不存在的测量文件夹
+        try:
+            for entry in os.scandir(self.monitor_path):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    current_dirs.append(entry.name)
+            current_dirs.sort()
+            if current_dirs != self.dirs:
+                self.dirs = current_dirs
+                self.dir_updated.emit(current_dirs)
+                self.update_watcher()
+                # 整个型号文件夹不存在时（如已移至待处理文件夹），一次删除其中所有测量文件夹
+                for dir in sorted(set(self.dir_entries) - set(current_dirs)):
+                    vanished.extend((dir, name) for name in sorted(self.dir_entries.pop(dir)))
+                    self.dir_mtimes.pop(dir, None)
+                    self.manifest.pop(dir, None)
+                    self.manifest_dirty.discard(dir)
+        except Exception as e:
+            pass
+
+        # 增量扫描测量文件夹
+        try:
+            vanished.extend(self.scan_dirs(folder_regex))
+        except Exception as e:
+            pass
+
+        # 删除不存在的图片文件夹数据
+        try:
+            for dir, name in vanished:
+                self.images.pop((dir, name), None)
+                self.queue.discard((dir, name))
+                self.settling.pop((dir, name), None)
+                self.unsettled.pop((dir, name), None)
+                self.crashed.discard((dir, name))
+                if self.image_cache is not None:
+                    self.image_cache.discard((dir, name))
+                if dir in self.manifest:
+                    self.update_manifest(dir, name, None)
+                self.post_update(dir, name, "delete")
+        except Exception as e:
+            pass
+
+        # 数据写入完成的测量文件夹加入队列
+        try:
+            self.check_settling()
+        except Exception as e:
+            pass
+        self.emit_queue_changed()
+
+    def render_next(self):
+        """从队列中取出一个测量文件夹，在当前线程中生成缩略图"""
+        key = self.queue.pop()
+        self.emit_queue_changed()
+        if key is None: return
+        dir, name = key
+        mtime = self.dir_entries.get(dir, {}).get(name)
+        if mtime is None: return
+        self.record(dir, name).mtime = mtime
+        status, errors, signature = self.render_thumbnail(dir, name)
+        if status is None: return
+        self.finish_render(dir, name, status, errors, signature)
+
+    def render_with_pool(self):
+        """
+        从队列中取出测量文件夹提交到进程池生成缩略图，并等待最多1秒处理已完成的结果
+        进程池中的任务数量保持为进程数量的2倍，避免队列中的任务全部提交后无法调整顺序
+        """
+        while len(self.futures) < self.workers * 2 and not self._stop:
+            key = self.queue.pop()
+            if key is None: break
+            dir, name = key
+            mtime = self.dir_entries.get(dir, {}).get(name)
+            if mtime is None: continue
+            self.record(dir, name).mtime = mtime
             try:
-                for entry in os.scandir(self.monitor_path):
-                    if entry.is_dir():
-                        current_dirs.append(entry.name)
-                current_dirs.sort()
-                if current_dirs != self.dirs:
-                    self.dirs = current_dirs
-                    self.dir_updated.emit(current_dirs)
-            except Exception as e:
-                pass
+                future = self.pool.submit(render_thumbnail_job, self.monitor_path, self.thumbnail_path, dir, name, self.threads, self.encoder_options())
+            except BrokenProcessPool:
+                self.queue.push(key)
+                self.restart_pool()
+                break
+            self.futures[future] = key
+        self.emit_queue_changed()
+        if not self.futures: return
 
-            # 删除不存在的图片文件夹数据
-            to_be_deleted = []
+        done, pending = wait(list(self.futures), timeout=1, return_when=FIRST_COMPLETED)
+        for future in done:
+            if self._stop: return
+            if isinstance(future.exception(), BrokenProcessPool):
+                self.restart_pool()
+                break
+            dir, name = self.futures.pop(future)
             try:
-                for dir,name in self.images.keys():
-                    if self._stop: return
-                    if not os.path.isdir(os.path.join(self.monitor_path, dir, name)):
-                        to_be_deleted.append((dir, name))
-                for dir, name in to_be_deleted:
-                    del self.images[(dir, name)]
-                    self.thumbnail_updated.emit(dir, name, "delete")
+                dir, name, status, errors, signature, images = future.result()
+                if images is not None:
+                    self.cache_thumbnail(dir, name, unpack_image(images[0]), unpack_image(images[1]))
             except Exception as e:
-                pass
-                    
-            # 创建图片文件
-            created_images_count = 0
+                status, errors, signature = "error", [f"{dir}/{name} 缩略图进程出错：{e}"], None
+            self.finish_render(dir, name, status, errors, signature)
+        self.emit_queue_changed()
+
+    def create_pool(self):
+        # Qt 对象不能安全地 fork，统一使用 spawn 方式启动子进程
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def restart_pool(self):
+        """
+        子进程意外退出后进程池无法继续使用，重新创建进程池
+        正在生成的测量文件夹重新加入队列一次，再次遇到子进程退出时作为出错处理
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.create_pool()
+        futures, self.futures = self.futures, {}
+        for dir, name in futures.values():
+            if (dir, name) in self.crashed:
+                self.finish_render(dir, name, "error", [f"{dir}/{name} 缩略图进程意外退出"], None)
+            else:
+                self.crashed.add((dir, name))
+                self.queue.push((dir, name))
+        self.emit_queue_changed()
+
+    def scan_dirs(self, folder_regex):
+        """
+        增量扫描型号文件夹中的测量文件夹
+        只重新列举修改时间有变化的型号文件夹，以及上次生成缩略图出错的测量文件夹，
+        新增或修改过的测量文件夹等待数据写入完成后加入缩略图生成队列，返回与上次列举结果相比已不存在的测量文件夹
+        """
+        vanished = []
+        for dir in self.dirs:
+            if self._stop: return vanished
+            dir_path = os.path.join(self.monitor_path, dir)
             try:
-                for dir in self.dirs:
-                    if created_images_count>=3: break        # 一次最多处理3个图片文件夹
-                    for entry in list(os.scandir(os.path.join(self.monitor_path, dir))):
-                        if self._stop: return
-                        if entry.is_dir():
-                            name = entry.name
-                            match = folder_regex.match(name)
-                            if match:
-                                mtime = entry.stat().st_mtime
-                                if ((dir, name) not in self.images) or ((dir, name) in self.images and mtime>self.images[(dir,name)]):
-                                    info = self.get_images(entry.path)
-                                    self.images[(dir, name)] = mtime
-                                    if info is None:
-                                        self.thumbnail_updated.emit(dir, name, "error")
-                                    else:
-                                        try:
-                                            if not info['Cali']:
-                                                self.error_occurred.emit(f"{dir}/{name} 测量数据未做标定！")
-                                            if len(info["H_C"])>0 and len(info["H_S"])>0:
-                                                if not os.path.isdir(os.path.join(self.thumbnail_path, dir)):
-                                                    os.mkdir(os.path.join(self.thumbnail_path, dir))
-                                                if self._stop: return
-                                                cs_image = self.merge_images(info["H_C"])
-                                                cs_image.save(os.path.join(self.thumbnail_path, dir, name+"_CS.png"),"PNG")
-                                                if self._stop: return
-                                                ss_image = self.merge_images(info["H_S"])
-                                                ss_image.save(os.path.join(self.thumbnail_path, dir, name+"_SS.png"),"PNG")
-                                                self.thumbnail_updated.emit(dir, name, "ok")
-                                                created_images_count += 1
-                                                break
-                                            else:
-                                                self.thumbnail_updated.emit(dir, name, "error")
-                                        except Exception as e:
-                                            self.thumbnail_updated.emit(dir, name, "error")
-                                            self.error_occurred.emit(f"{dir}/{name} 创建缩略图时出错：{e}")
-            except Exception as e:
-                pass
+                scan_time = time.time()
+                dir_mtime = os.stat(dir_path).st_mtime
+                if dir_mtime == self.dir_mtimes.get(dir): continue
+                entries = {}
+                for entry in os.scandir(dir_path):
+                    if entry.is_dir() and folder_regex.match(entry.name):
+                        entries[entry.name] = entry.stat().st_mtime
+            except OSError:
+                continue
+            # 修改时间距离扫描时间太近时，同一时间精度内可能还有新的变化，下次仍需重新列举
+            self.dir_mtimes[dir] = dir_mtime if scan_time - dir_mtime > 2 else None
+            vanished.extend((dir, name) for name in sorted(self.dir_entries.get(dir, {}).keys() - entries.keys()))
+            self.dir_entries[dir] = entries
+            for name, mtime in entries.items():
+                record = self.images.get((dir, name))
+                if record is None or mtime > record.mtime:
+                    self.settle((dir, name))
 
-            if self.interval == 0: return
-            if created_images_count==0:
-                # 没有创建图片时才休眠
-                for i in range(self.interval):
-                    if self._stop: return
-                    time.sleep(1)
+        # 出错的测量文件夹中的数据变化不会改变型号文件夹的修改时间，图片写入通道子文件夹时
+        # 测量文件夹的修改时间也不变，需要按写入签名单独检查
+        for (dir, name), signature in list(self.unsettled.items()):
+            entries = self.dir_entries.get(dir, {})
+            if name not in entries:
+                self.unsettled.pop((dir, name), None)
+                continue
+            folder_path = os.path.join(self.monitor_path, dir, name)
+            try:
+                entries[name] = os.stat(folder_path).st_mtime
+                current, newest = self.settle_signature(folder_path)
+            except OSError:
+                continue
+            if current != signature:
+                self.unsettled[(dir, name)] = current
+                self.settle((dir, name))
+        return vanished
+
+    def settle(self, key):
+        """测量文件夹有变化，等待数据写入完成后再生成缩略图"""
+        if self.settle_time <= 0:
+            self.queue.push(key)
+        else:
+            self.settling[key] = None
+
+    def check_settling(self):
+        """
+        检查等待中的测量文件夹，子文件夹和图片大小保持 settle_time 秒不变后加入队列
+        首次检查时所有文件的修改时间都早于 settle_time 秒之前的，直接加入队列
+        """
+        now = time.time()
+        for key, state in list(self.settling.items()):
+            if self._stop: return
+            dir, name = key
+            try:
+                signature, newest = self.settle_signature(os.path.join(self.monitor_path, dir, name))
+            except OSError:
+                continue
+            if state is None:
+                if now - newest >= self.settle_time:
+                    del self.settling[key]
+                    self.queue.push(key)
+                else:
+                    self.settling[key] = (signature, now)
+            elif signature != state[0]:
+                self.settling[key] = (signature, now)
+            elif now - state[1] >= self.settle_time:
+                del self.settling[key]
+                self.queue.push(key)
+
+    def emit_queue_changed(self):
+        """发送等待生成缩略图的测量文件夹数量"""
+        self.queue_changed.emit(len(self.queue) + len(self.settling) + len(self.futures))
+
+    def update_watcher(self):
+        """更新需要监控变化事件的文件夹：监控根目录和所有型号文件夹"""
+        if self.watcher is None: return
+        paths = {os.path.normpath(self.monitor_path)}
+        for dir in self.dirs:
+            paths.add(os.path.normpath(os.path.join(self.monitor_path, dir)))
+        watched = {os.path.normpath(path) for path in self.watcher.directories()}
+        if watched - paths:
+            self.watcher.removePaths(sorted(watched - paths))
+        if paths - watched:
+            self.watcher.addPaths(sorted(paths - watched))
+
+    def is_watching(self):
+        """文件夹变化事件是否可用，不支持事件的网络路径等情况下退回定时轮询"""
+        if self.watcher is None: return False
+        return os.path.normpath(self.monitor_path) in {os.path.normpath(path) for path in self.watcher.directories()}
+
+    @Slot(str)
+    def directory_changed(self, path):
+        """收到文件夹变化事件，结束等待立即扫描"""
+        self.changed_paths.add(path)
+        if self.wait_loop is not None:
+            self.wait_loop.quit()
+
+    def wait_for_changes(self, timeout):
+        """
+        等待 timeout 秒，期间收到文件夹变化事件或线程停止时提前返回
+        收到事件后继续等待到1秒内没有新的事件，避免在文件夹刚创建、数据还在写入时扫描
+        """
+        quiet = False
+        for i in range(timeout):
+            if self._stop: break
+            if self.changed_paths:
+                self.changed_paths.clear()
+                quiet = True
+            elif quiet:
+                break
+            if self.watcher is None:
+                time.sleep(1)
+                continue
+            self.wait_loop = QEventLoop()
+            QTimer.singleShot(1000, self.wait_loop.quit)
+            self.wait_loop.exec()
+            self.wait_loop = None
+        self.changed_paths.clear()
+
+    def finish_render(self, dir, name, status, errors, signature):
+        """发送缩略图生成结果，并更新缩略图缓存清单"""
+        if name not in self.dir_entries.get(dir, {}):
+            return      # 生成期间测量文件夹已被删除
+        self.update_manifest(dir, name, signature if status == "ok" else None)
+        record = self.record(dir, name)
+        record.status = Status.OK if status == "ok" else Status.ERROR
+        record.signature = signature if status == "ok" else None
+        self.crashed.discard((dir, name))
+        if status == "ok":
+            self.unsettled.pop((dir, name), None)
+        else:
+            try:
+                self.unsettled[(dir, name)] = self.settle_signature(os.path.join(self.monitor_path, dir, name))[0]
+            except OSError:
+                self.unsettled[(dir, name)] = None
+        self.post_update(dir, name, status)
+        for error in errors:
+            self.error_occurred.emit(error)
+
+    def record(self, dir, name):
+        """获取测量文件夹的状态记录，不存在时创建"""
+        record = self.images.get((dir, name))
+        if record is None:
+            record = self.images[(dir, name)] = FolderRecord(dir, name)
+        return record
+
+    def post_update(self, dir, name, status):
+        """记录缩略图状态更新，由 flush_updates 一次发送"""
+        self.updates.append((dir, name, status))
+
+    def flush_updates(self):
+        """批量发送记录的缩略图状态更新"""
+        if not self.updates: return
+        updates, self.updates = self.updates, []
+        self.thumbnails_updated.emit(updates)
 
     @Slot()
     def stop(self):
         """停止线程"""
         self._stop = True
 
+    def set_priority(self, dir, name=""):
+        """
+        设置优先生成缩略图的型号和测量文件夹，由界面线程直接调用
+        """
+        self.queue.set_priority(dir, name)
+
+    def load_manifest(self, dir):
+        """读取指定型号的缩略图缓存清单"""
+        if dir not in self.manifest:
+            try:
+                with open(os.path.join(self.thumbnail_path, dir, MANIFEST_NAME), "r") as f:
+                    self.manifest[dir] = json.load(f)
+            except Exception:
+                self.manifest[dir] = {}
+        return self.manifest[dir]
+
+    def update_manifest(self, dir, name, signature):
+        """更新缩略图缓存清单，signature 为 None 时删除记录"""
+        manifest = self.load_manifest(dir)
+        if signature is None:
+            if name not in manifest: return
+            del manifest[name]
+        else:
+            manifest[name] = {"signature": signature, "options": self.manifest_options()}
+        self.manifest_dirty.add(dir)
+
+    def save_manifests(self):
+        """保存有变化的缩略图缓存清单"""
+        for dir in sorted(self.manifest_dirty):
+            try:
+                path = os.path.join(self.thumbnail_path, dir, MANIFEST_NAME)
+                if not os.path.isdir(os.path.dirname(path)):
+                    continue
+                with open(path + ".tmp", "w") as f:
+                    json.dump(self.manifest[dir], f)
+                os.replace(path + ".tmp", path)
+            except Exception as e:
+                self.error_occurred.emit(f"无法保存缩略图缓存清单 {dir}：{e}")
+        self.manifest_dirty.clear()
+
+    def is_thumbnail_current(self, dir, name):
+        """判断已有的缩略图是否与测量数据和生成参数一致"""
+        entry = self.load_manifest(dir).get(name)
+        if not entry or entry.get("options") != self.manifest_options():
+            return False
+        for variant in ("CS", "SS"):
+            if not os.path.isfile(os.path.join(self.thumbnail_path, dir, thumbnail_file(name, variant, self.thumbnail_format))):
+                return False
+        folder_path = os.path.join(self.monitor_path, dir, name)
+        try:
+            info = self.get_images(folder_path)
+            return info is not None and entry.get("signature") == self.source_signature(folder_path, info)
+        except OSError:
+            return False
+
+    def encoder_options(self):
+        """缩略图格式参数，传递给进程池中的任务"""
+        return {
+            "thumbnail_format": self.thumbnail_format,
+            "thumbnail_quality": self.thumbnail_quality,
+            "thumbnail_compression": self.thumbnail_compression
+        }
+
+    def manifest_options(self):
+        """缩略图缓存清单中记录的生成参数，缩略图格式变化后文件名不同，需要重新生成"""
+        return dict(self.render_options, format=self.thumbnail_format)
+
+    def save_thumbnail(self, image, path):
+        """按设置的格式和压缩参数保存缩略图"""
+        writer = QImageWriter(path, self.thumbnail_format.encode())
+        if self.thumbnail_format == "png" and self.thumbnail_compression >= 0:
+            # Qt 的 PNG 压缩参数为 0~100，按 参数*9/100 取整换算为 zlib 压缩级别
+            writer.setCompression((min(self.thumbnail_compression, 9) * 100 + 8) // 9)
+        if self.thumbnail_format in ("jpg", "webp") and self.thumbnail_quality >= 0:
+            writer.setQuality(self.thumbnail_quality)
+        if not writer.write(image):
+            raise ValueError(f"无法保存缩略图 {path}：{writer.errorString()}")
+        return image
+
+    def cache_thumbnail(self, dir, name, cs_image, ss_image):
+        """将生成的缩略图放入共享缓存，界面显示时不需要再从磁盘读取"""
+        if self.image_cache is None: return
+        self.image_cache.put((dir, name, "CS"), cs_image)
+        self.image_cache.put((dir, name, "SS"), ss_image)
+
+    def source_signature(self, folder_path, info):
+        """测量数据签名：文件夹和所有图片的修改时间、大小"""
+        signature = [os.stat(folder_path).st_mtime, info["Cali"]]
+        for img_path in info["H_C"] + info["H_S"]:
+            size, mtime = info["Files"][img_path]
+            signature.append([os.path.relpath(img_path, folder_path), size, mtime])
+        return signature
+
+
+    def render_thumbnail(self, dir, name):
+        """
+        生成指定测量文件夹的 CS/SS 缩略图
+        返回 (状态, 错误信息列表, 数据签名)，状态为 ok 或 error，线程停止时状态为 None
+        """
+        errors = []
+        folder_path = os.path.join(self.monitor_path, dir, name)
+        info = self.get_images(folder_path)
+        if info is None:
+            return "error", errors, None
+        try:
+            signature = self.source_signature(folder_path, info)
+            if not info['Cali']:
+                errors.append(f"{dir}/{name} 测量数据未做标定！")
+            if len(info["H_C"])>0 and len(info["H_S"])>0:
+                os.makedirs(os.path.join(self.thumbnail_path, dir), exist_ok=True)
+                cs_path = os.path.join(self.thumbnail_path, dir, thumbnail_file(name, "CS", self.thumbnail_format))
+                ss_path = os.path.join(self.thumbnail_path, dir, thumbnail_file(name, "SS", self.thumbnail_format))
+                if self._stop: return None, errors, None
+                if self.executor is not None:
+                    # 同时解码 CS/SS 的所有图片，再并行拼接和保存两张缩略图
+                    decode_options = {key: self.render_options[key] for key in ("overlay", "top_ignore", "scale")}
+                    cs_tiles = self.decode_tiles(info["H_C"], executor=self.executor, **decode_options)
+                    ss_tiles = self.decode_tiles(info["H_S"], executor=self.executor, **decode_options)
+                    cs_tiles = list(cs_tiles)
+                    ss_tiles = list(ss_tiles)
+                    if self._stop: return None, errors, None
+                    cs_future = self.executor.submit(lambda: self.save_thumbnail(self.merge_images(info["H_C"], tiles=cs_tiles, **self.render_options), cs_path))
+                    ss_future = self.executor.submit(lambda: self.save_thumbnail(self.merge_images(info["H_S"], tiles=ss_tiles, **self.render_options), ss_path))
+                    self.cache_thumbnail(dir, name, cs_future.result(), ss_future.result())
+                    return "ok", errors, signature
+                cs_image = self.merge_images(info["H_C"], **self.render_options)
+                self.save_thumbnail(cs_image, cs_path)
+                if self._stop: return None, errors, None
+                ss_image = self.merge_images(info["H_S"], **self.render_options)
+                self.save_thumbnail(ss_image, ss_path)
+                self.cache_thumbnail(dir, name, cs_image, ss_image)
+                return "ok", errors, signature
+            else:
+                return "error", errors, None
+        except Exception as e:
+            errors.append(f"{dir}/{name} 创建缩略图时出错：{e}")
+            return "error", errors, None
+
+    def list_folder(self, folder_path):
+        """
+        列举测量文件夹及 H/C1~C4 通道文件夹，每个文件夹只列举一次
+        返回 (子文件夹名称集合, {图片前缀: {文件名: DirEntry}})，名称按系统规则忽略大小写，
+        测量文件夹不存在时子文件夹集合为 None
+        """
+        channels = {"AH":{}, "BH":{}, "CH":{}, "DH":{}}
+        try:
+            subdirs = {os.path.normcase(entry.name) for entry in os.scandir(folder_path) if entry.is_dir()}
+        except OSError:
+            return None, channels
+        if os.path.normcase("H") in subdirs:
+            for channel, prefix in (("C1","AH"), ("C2","BH"), ("C3","CH"), ("C4","DH")):
+                try:
+                    for entry in os.scandir(os.path.join(folder_path, "H", channel)):
+                        if entry.is_file():
+                            channels[prefix][os.path.normcase(entry.name)] = entry
+                except OSError:
+                    pass
+        return subdirs, channels
 
     def get_images(self, folder_path):
         """
         获取指定文件夹下的所有TIF图片路径
+        每个文件夹只列举一次，在内存中匹配各通道的图片，
+        返回结果中的 Files 为所有图片的 {路径: (大小, 修改时间)}
         """
         images={
             "H_C":[],
             "H_S":[],
-            "Cali":False    # 是否存在标定文件夹
+            "Cali":False,   # 是否存在标定文件夹
+            "Files":{}      # 图片文件的大小和修改时间
         }
 
-        if os.path.isdir(os.path.join(folder_path, "Cali")):
+        subdirs, channels = self.list_folder(folder_path)
+        if subdirs is None:
+            return images
+        if os.path.normcase("Cali") in subdirs:
             images["Cali"]=True
-        if os.path.isdir(os.path.join(folder_path, "H")):
+        if os.path.normcase("H") in subdirs:
             i=1
-            AH=os.path.join(folder_path, "H","C1",f"AH{i}.tif")
-            while os.path.isfile(AH):
-                BH=os.path.join(folder_path, "H","C2",f"BH{i}.tif")
-                CH=os.path.join(folder_path, "H","C3",f"CH{i}.tif")
-                DH=os.path.join(folder_path, "H","C4",f"DH{i}.tif")
-                images[f"H_C"].append(AH)
-                if os.path.isfile(BH):
-                    images[f"H_C"].append(BH)
-                else:
-                    return None
-                if os.path.isfile(CH):
-                    images[f"H_S"].append(CH)
-                else:
-                    return None
-                if os.path.isfile(DH):
-                    images[f"H_S"].append(DH)
-                else:
-                    return None
-                
+            while os.path.normcase(f"AH{i}.tif") in channels["AH"]:
+                for prefix, key in (("AH","H_C"), ("BH","H_C"), ("CH","H_S"), ("DH","H_S")):
+                    entry = channels[prefix].get(os.path.normcase(f"{prefix}{i}.tif"))
+                    if entry is None:
+                        return None
+                    stat = entry.stat()
+                    images[key].append(entry.path)
+                    images["Files"][entry.path] = (stat.st_size, stat.st_mtime)
                 i+=1
-                AH=os.path.join(folder_path, "H","C1",f"AH{i}.tif")
 
         return images
 
-    def merge_images(self, image_paths, overlay=65, top_ignore=520, scale=0.05, crop_threshold=0.8):
+    def settle_signature(self, folder_path):
+        """
+        判断测量文件夹是否写入完成所用的签名：子文件夹和所有通道图片的名称、大小
+        返回 (签名, 最新的修改时间)
+        """
+        subdirs, channels = self.list_folder(folder_path)
+        files = []
+        newest = os.stat(folder_path).st_mtime
+        for prefix in sorted(channels):
+            for name, entry in sorted(channels[prefix].items()):
+                stat = entry.stat()
+                files.append((prefix, name, stat.st_size))
+                newest = max(newest, stat.st_mtime)
+        return (tuple(sorted(subdirs or ())), tuple(files)), newest
+
+    def find_top_crop(self, img, start_row, overlay_crop, crop_threshold, img_path="", last_row=None):
+        """
+        查找图片顶部裁切位置
+        一次性读取图片上半部分的扫描线数据，计算每行红色通道大于10的像素数量，
+        从 start_row 开始累计，返回累计数量超过 crop_threshold 的第一行，最多检测到 last_row 行
+        """
+        crop_width = img.width() - overlay_crop * 2
+        if last_row is None:
+            last_row = img.height() // 2
+        if crop_width <= 0 or start_row > last_row or last_row >= img.height():
+            raise ValueError(f"图片 {img_path} 没有找到顶部裁切位置")
+
+        # 只转换需要检测的区域，RGB888 格式每个像素3字节，第1个字节为红色通道
+        region = img.copy(overlay_crop, 0, crop_width, last_row + 1).convertToFormat(QImage.Format_RGB888)
+        bytes_per_line = region.bytesPerLine()
+        buffer = region.constBits().tobytes().translate(RED_THRESHOLD_TABLE)
+        row_size = crop_width * 3
+
+        # 每行的有效像素数量
+        profile = [
+            buffer[offset:offset + row_size:3].count(1)
+            for offset in range(0, bytes_per_line * (last_row + 1), bytes_per_line)
+        ]
+
+        count = 0
+        for row in range(start_row, last_row + 1):
+            count += profile[row]
+            if count / crop_width > crop_threshold:
+                return row
+        raise ValueError(f"图片 {img_path} 没有找到顶部裁切位置")
+
+    def load_scaled_image(self, img_path, scale, clip_left=0, clip_top=0):
+        """
+        按缩放比例加载图片，并裁掉左右 clip_left 和顶部 clip_top 的区域（缩放后的坐标）
+        图片格式支持时由 QImageReader 直接按目标尺寸解码，否则先完整加载再缩放
+        返回 (裁剪后的图片, 缩放后的完整尺寸, 原图格式)
+        """
+        reader = QImageReader(img_path)
+        size = reader.size()
+        if (size.isValid()
+                and reader.supportsOption(QImageIOHandler.ScaledSize)
+                and reader.supportsOption(QImageIOHandler.ScaledClipRect)):
+            scaled_size = QSize(int(size.width() * scale), int(size.height() * scale))
+            clip = QRect(clip_left, clip_top, scaled_size.width() - clip_left * 2, scaled_size.height() - clip_top)
+            if clip.isValid():
+                img_format = reader.imageFormat()
+                reader.setScaledSize(scaled_size)
+                reader.setScaledClipRect(clip)
+                img = reader.read()
+                if not img.isNull():
+                    return img, scaled_size, img_format
+
+        # 不支持按尺寸解码时，沿用完整加载后缩放的方式
+        img = QImage(img_path)
+        if img.isNull():
+            raise ValueError(f"无法加载图片 {img_path}")
+        img_format = img.format()
+        img = img.scaled(
+            int(img.width() * scale), 
+            int(img.height() * scale), 
+            Qt.IgnoreAspectRatio, 
+            Qt.SmoothTransformation
+        )
+        scaled_size = img.size()
+        img = img.copy(clip_left, clip_top, scaled_size.width() - clip_left * 2, scaled_size.height() - clip_top)
+        return img, scaled_size, img_format
+
+    def decode_tiles(self, image_paths, overlay=65, top_ignore=520, scale=0.05, executor=None):
+        """
+        按缩放比例解码图片列表，奇数位图片在解码时裁掉顶部忽略区域，所有图片裁掉左右重叠区域
+        返回 [(图片, 缩放后的完整尺寸, 原图格式)]，提供 executor 时所有图片同时提交到线程池解码，
+        返回的是按顺序产生结果的迭代器
+        """
+        overlay_crop = int(round(overlay * scale))
+        clip_tops = [int(round(top_ignore * scale)) if idx % 2 == 0 else 0 for idx in range(len(image_paths))]
+        if executor is None:
+            return [self.load_scaled_image(img_path, scale, overlay_crop, clip_top) for img_path, clip_top in zip(image_paths, clip_tops)]
+        return executor.map(lambda img_path, clip_top: self.load_scaled_image(img_path, scale, overlay_crop, clip_top), image_paths, clip_tops)
+
+    def merge_images(self, image_paths, overlay=65, top_ignore=520, scale=0.05, crop_threshold=0.8, tiles=None):
+        """
+        裁剪并横向拼接图片，tiles 为 decode_tiles 预先解码的结果，未提供时依次解码
+        """
         if not image_paths:
             raise ValueError("图片列表不能为空")
+        if tiles is None:
+            tiles = self.decode_tiles(image_paths, overlay, top_ignore, scale)
         
         odd_top_crop = int(round(top_ignore * scale))
         even_top_crop = 0
-        overlay_crop=int(round(overlay * scale))
         
         processed_images = []
-        for idx, img_path in enumerate(image_paths):
-            img = QImage(img_path)
-            img_format = img.format()
-            if img.isNull():
-                raise ValueError(f"无法加载图片 {img_path}")
-            
-            # 缩放图片
-            img = img.scaled(
-                int(img.width() * scale), 
-                int(img.height() * scale), 
-                Qt.IgnoreAspectRatio, 
-                Qt.SmoothTransformation
-            )
-
-            # 获取图片裁剪尺寸
+        for idx, (img_path, tile) in enumerate(zip(image_paths, tiles)):
+            img, scaled_size, img_format = tile
+            clip_top = int(round(top_ignore * scale)) if idx % 2 == 0 else 0
+
+            # 获取图片裁剪尺寸，检测范围为缩放后图片的上半部分
+            last_row = scaled_size.height() // 2 - clip_top
             if idx == 0:
-                crop_width = img.width() - overlay_crop * 2
-                count=0
-                while True:
-                    if odd_top_crop > img.height()//2:
-                        raise ValueError(f"图片 {img_path} 没有找到顶部裁切位置")
-                    for i in range(crop_width):
-                        if img.pixelColor(i+overlay_crop,odd_top_crop).red() > 10:
-                            count+=1
-                    if count/crop_width > crop_threshold:
-                        break
-                    odd_top_crop += 1
+                odd_top_crop = clip_top + self.find_top_crop(img, 0, 0, crop_threshold, img_path, last_row)
             elif idx == 1:
-                crop_width = img.width() - overlay_crop * 2
-                count=0
-                while True:
-                    if even_top_crop > img.height()//2:
-                        raise ValueError(f"图片 {img_path} 没有找到顶部裁切位置")
-                    for i in range(crop_width):
-                        if img.pixelColor(i+overlay_crop,even_top_crop).red() > 10:
-                            count+=1
-                    if count/crop_width > crop_threshold:
-                        break
-                    even_top_crop += 1
-
-            crop_width = img.width() - overlay_crop * 2
-            crop_heigth = img.height() - odd_top_crop
+                even_top_crop = clip_top + self.find_top_crop(img, 0, 0, crop_threshold, img_path, last_row)
+
+            crop_heigth = scaled_size.height() - odd_top_crop
             if idx % 2 == 0:
-                img = img.copy(overlay_crop, odd_top_crop, crop_width, crop_heigth)
+                img = img.copy(0, odd_top_crop - clip_top, img.width(), crop_heigth)
             else:
-                img = img.copy(overlay_crop, even_top_crop, crop_width, crop_heigth)
+                img = img.copy(0, even_top_crop - clip_top, img.width(), crop_heigth)
             
             processed_images.append(img)
 
@@ -245,6 +1018,233 @@ class MonitorDir(QObject):
         return merged_image
 
 
+class DeleteQueue(QObject):
+    """
+    后台删除文件夹的队列
+    文件夹先重命名到同一分区的回收文件夹中，再由线程池同时删除其中的文件，
+    程序退出或删除失败时剩余的内容保留在回收文件夹中，调用 resume 时继续删除
+    回收文件夹无法创建时构造函数抛出 OSError
+    """
+    error_occurred = Signal(str)
+
+    def __init__(self, trash_path, threads=4, parent=None):
+        super().__init__(parent)
+        self.trash_path = trash_path
+        os.makedirs(trash_path, exist_ok=True)
+        self.folder_executor = ThreadPoolExecutor(max_workers=1)        # 依次处理回收文件夹中的文件夹
+        self.file_executor = ThreadPoolExecutor(max_workers=threads)    # 同时删除文件夹中的文件
+        self._stop = False
+
+    def resume(self):
+        """继续删除回收文件夹中上次未删除完的内容，需在连接 error_occurred 信号后调用"""
+        try:
+            for entry in os.scandir(self.trash_path):
+                self.folder_executor.submit(self.remove_tree, entry.path)
+        except OSError as e:
+            self.error_occurred.emit(f"无法读取回收文件夹 {self.trash_path}：{e}")
+
+    def delete(self, path):
+        """将文件夹移到回收文件夹后立即返回，文件在后台删除"""
+        target = os.path.join(self.trash_path, f"{time.time_ns()}_{os.path.basename(path)}")
+        os.rename(path, target)
+        self.folder_executor.submit(self.remove_tree, target)
+
+    def shutdown(self):
+        self._stop = True
+        self.folder_executor.shutdown(wait=False, cancel_futures=True)
+        self.file_executor.shutdown(wait=False, cancel_futures=True)
+
+    def remove_tree(self, path):
+        files = []
+        for root, dirs, names in os.walk(path):
+            files.extend(os.path.join(root, name) for name in names)
+        try:
+            futures = [self.file_executor.submit(os.remove, file) for file in files]
+        except RuntimeError:
+            return      # 已退出，剩余的文件下次启动时删除
+        wait(futures)
+        if self._stop: return
+        # 每个文件夹只报告一次错误，未删除的内容保留在回收文件夹中
+        errors = [future.exception() for future in futures if not future.cancelled() and future.exception() is not None]
+        try:
+            if errors:
+                raise errors[0]
+            shutil.rmtree(path)
+        except OSError as e:
+            self.error_occurred.emit(f"无法删除文件夹 {os.path.basename(path)}，将在下次启动时重试：{e}")
+
+
+class TransferJob(QObject):
+    """
+    将确认完成的型号文件夹发送至待处理文件夹的后台任务
+    先删除标记为删除的测量文件夹，再移动整个型号文件夹，运行期间可随时取消
+    指定 delete_queue 时测量文件夹只移到回收文件夹，由 DeleteQueue 在后台删除，不需要等待删除完成
+    同一分区时直接重命名，不同分区时多个文件同时复制到目标路径旁的临时文件夹，每个文件完成后记录在日志中，
+    取消或中断后再次发送同一型号时跳过已复制的文件，全部复制并核对大小后才重命名为目标路径并删除型号文件夹
+    """
+    progress = Signal(str, int, int)    # 当前步骤, 已完成数量, 总数量
+    finished = Signal(str, str)         # dir, status(ok,cancel,error)
+    error_occurred = Signal(str)
+
+    def __init__(self, source, target, deletes=(), streams=4, buffer_size=8 * 1024 * 1024, delete_queue=None):
+        super().__init__()
+        self.source = source            # 型号文件夹
+        self.target = target            # 待处理文件夹中的目标路径
+        self.deletes = list(deletes)    # 需要删除的测量文件夹
+        self.delete_queue = delete_queue
+        self.streams = max(1, streams)  # 同时复制的文件数量
+        self.buffer_size = buffer_size  # 复制文件时每次读写的字节数
+        self.staging = target + ".transfer"             # 复制中的临时文件夹，完成后重命名为目标路径
+        self.journal_path = target + ".transfer.log"    # 已复制完成的文件日志，每行一个相对路径
+        self._stop = False
+
+    @Slot()
+    def run(self):
+        """线程主函数"""
+        dir = os.path.basename(self.source)
+        try:
+            status = "ok" if self.transfer() else "cancel"
+        except Exception as e:
+            self.error_occurred.emit(f"无法发送 {dir} 数据至待处理文件夹：{e}")
+            status = "error"
+        self.finished.emit(dir, status)
+
+    def stop(self):
+        """取消任务，型号文件夹保持不变，已复制的文件保留用于下次继续发送"""
+        self._stop = True
+
+    def transfer(self):
+        """执行删除和移动，取消时返回 False"""
+        for i, path in enumerate(self.deletes):
+            if self._stop: return False
+            self.progress.emit("删除", i, len(self.deletes))
+            if not os.path.exists(path): continue
+            if self.delete_queue is not None:
+                self.delete_queue.delete(path)
+            else:
+                shutil.rmtree(path)
+
+        if os.path.exists(self.target):
+            # 复制完成并重命名后中断时，日志仍在，只需删除型号文件夹
+            # 临时文件夹仍在时说明目标不是本次复制的结果，不能删除型号文件夹
+            if not os.path.isfile(self.journal_path) or os.path.exists(self.staging):
+                raise ValueError(f"目标文件夹已存在 {self.target}")
+            if os.path.exists(self.source):
+                shutil.rmtree(self.source)
+            os.remove(self.journal_path)
+            return True
+        # 同一分区直接重命名，有上次中断的复制时继续复制
+        if not os.path.exists(self.staging):
+            try:
+                os.rename(self.source, self.target)
+                return True
+            except OSError as e:
+                if e.errno != errno.EXDEV: raise
+
+        if not self.copy_tree(): return False
+        # 型号文件夹删除后才删除日志，中断后再次发送时可以继续删除
+        os.rename(self.staging, self.target)
+        shutil.rmtree(self.source)
+        os.remove(self.journal_path)
+        return True
+
+    def copy_tree(self):
+        """不同分区时复制型号文件夹中的所有文件，取消时返回 False"""
+        files = []
+        for root, dirs, names in os.walk(self.source):
+            files.extend(os.path.relpath(os.path.join(root, name), self.source) for name in names)
+            os.makedirs(os.path.join(self.staging, os.path.relpath(root, self.source)), exist_ok=True)
+
+        # 日志中记录已完成且大小一致的文件不再复制，最后一行可能未写完整
+        copied = set()
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                copied = {line[:-1] for line in f if line.endswith("\n")}
+        except FileNotFoundError:
+            pass
+        pending = [file for file in files if file not in copied or not self.same_size(file)]
+
+        done = len(files) - len(pending)
+        self.progress.emit("复制", done, len(files))
+        with open(self.journal_path, "a", encoding="utf-8") as journal, ThreadPoolExecutor(max_workers=self.streams) as executor:
+            futures = {executor.submit(self.copy_file, file): file for file in pending}
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    journal.write(futures[future] + "\n")
+                    journal.flush()
+                    done += 1
+                    self.progress.emit("复制", done, len(files))
+                    if self._stop: break
+            finally:
+                for future in futures:
+                    future.cancel()
+        if self._stop: return False
+
+        # 删除上次复制后已从型号文件夹中删除的文件和文件夹
+        sources = set(files)
+        for root, dirs, names in os.walk(self.staging, topdown=False):
+            for name in names:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.staging) not in sources:
+                    os.remove(path)
+            if root != self.staging and not os.path.isdir(os.path.join(self.source, os.path.relpath(root, self.staging))):
+                os.rmdir(root)
+
+        # 删除型号文件夹前核对所有文件的大小
+        for file in files:
+            if not self.same_size(file):
+                raise ValueError(f"复制后文件大小不一致 {file}")
+        return True
+
+    def copy_file(self, file):
+        source = os.path.join(self.source, file)
+        target = os.path.join(self.staging, file)
+        with open(source, "rb") as fsrc, open(target, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, self.buffer_size)
+        shutil.copystat(source, target)
+
+    def same_size(self, file):
+        try:
+            return os.path.getsize(os.path.join(self.source, file)) == os.path.getsize(os.path.join(self.staging, file))
+        except OSError:
+            return False
+
+
+def thumbnail_file(name, variant, format="png"):
+    """缩略图文件名，variant 为 CS 或 SS"""
+    return f"{name}_{variant}.{THUMBNAIL_FORMATS[format.lower()]}"
+
+
+def pack_image(image):
+    """将 QImage 转换为可以在进程间传递的数据"""
+    return image.width(), image.height(), image.bytesPerLine(), image.format().value, image.constBits().tobytes()
+
+
+def unpack_image(data):
+    """由 pack_image 的数据还原 QImage"""
+    width, height, bytes_per_line, format, buffer = data
+    return QImage(buffer, width, height, bytes_per_line, QImage.Format(format)).copy()
+
+
+def render_thumbnail_job(monitor_path, thumbnail_path, dir, name, threads=0, encoder_options=None):
+    """
+    进程池任务：在子进程中生成指定测量文件夹的缩略图
+    生成成功时同时返回缩略图数据，由主进程放入与界面共享的缓存
+    """
+    cache = ImageCache(1 << 30)
+    monitor = MonitorDir(monitor_path, thumbnail_path, threads=threads, image_cache=cache, **(encoder_options or {}))
+    try:
+        status, errors, signature = monitor.render_thumbnail(dir, name)
+    finally:
+        if monitor.executor is not None:
+            monitor.executor.shutdown()
+    images = None
+    if status == "ok":
+        images = (pack_image(cache.get((dir, name, "CS"))), pack_image(cache.get((dir, name, "SS"))))
+    return dir, name, status, errors, signature, images
+
+
 if __name__ == "__main__":
     ex = MonitorDir("E:/Images","E:/Thumbnails",interval=0)
     ex.start_monitor()
\ No newline at end of file